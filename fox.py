@@ -1,13 +1,16 @@
-import imaplib
-import email
 import os
+import re
 import sys
+import json
 import shutil
-import mimetypes
-from email.header import decode_header
+import functools
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from email.utils import parseaddr
+
+# imaplib, email and mimetypes are imported where they are first used so that
+# the banner and account prompt appear without waiting on them.
 
 # Banner art
 BANNER = r"""
@@ -30,6 +33,707 @@ DEFAULT_EMAIL_USER = "example@example.com"
 DEFAULT_EMAIL_PASSWORD = "123456"
 DEFAULT_IMAP_SERVER = "imap.example.com"
 DEFAULT_IMAP_PORT = 993
+DEFAULT_SMTP_PORT = 465
+
+# Seconds without a server response before the connection counts as dropped
+IMAP_TIMEOUT = 60
+
+# Reconnect settings
+RECONNECT_ATTEMPTS = 4
+RECONNECT_DELAY = 1             # seconds before the second attempt, doubled after that
+
+# Outbox delivery settings
+OUTBOX_MAX_ATTEMPTS = 6         # give up after this many failed attempts
+OUTBOX_RETRY_DELAY = 30         # seconds before the first retry, doubled after each failure
+OUTBOX_MAX_RETRY_DELAY = 3600   # longest wait between retries
+SMTP_IDLE_TIMEOUT = 60          # seconds a pooled SMTP connection may sit unused
+SMTP_TIMEOUT = 30
+SENT_APPEND_BATCH = 50          # delivered messages appended to Sent per pass
+
+# Messages per FETCH when only a few header fields are needed
+HEADER_BATCH_SIZE = 5000
+
+# Longest message set put on one FETCH line, RFC 7162 advises keeping lines under 8 KB
+MAX_ID_SET_LENGTH = 4000
+
+# Separator line between entries in accounts.txt
+ACCOUNT_SEPARATOR = "-" * 30
+
+# RFC 6154 special-use attributes we remember per account
+SPECIAL_USE_FLAGS = ('\\All', '\\Archive', '\\Drafts', '\\Flagged', '\\Junk', '\\Sent', '\\Trash')
+
+LIST_RESPONSE_RE = re.compile(r'^\((?P<flags>[^)]*)\) (?P<delim>"(?:[^"\\]|\\.)*"|NIL) (?P<name>.+)$')
+
+# Messages requested per FETCH command, keeps command lines well under server limits
+FETCH_BATCH_SIZE = 200
+
+CAPABILITY_CODE_RE = re.compile(rb'\[CAPABILITY ([^\]]*)\]', re.IGNORECASE)
+
+
+class BackgroundConnect:
+    """Open the TCP/TLS connection to an IMAP server on a worker thread"""
+
+    def __init__(self, server, port):
+        self.server = server
+        self.port = port
+        self.conn = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            import imaplib
+            self.conn = imaplib.IMAP4_SSL(self.server, self.port, timeout=IMAP_TIMEOUT)
+        except Exception as e:
+            self.error = e
+
+    def result(self, server, port):
+        """Wait for the connection and return it, or None if it targets another server
+
+        Raises the error the connection attempt failed with, so the caller
+        does not block on a second attempt against an unreachable server.
+        """
+        self.thread.join()
+        if (server, port) != (self.server, self.port):
+            if self.conn is not None:
+                try:
+                    self.conn.shutdown()
+                except Exception:
+                    pass
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.conn
+
+
+class Outbox:
+    """Durable on-disk queue of messages waiting to be sent
+
+    Each message is stored as <id>.eml with an <id>.json sidecar in queue/.
+    The sidecar is written last, so a message only counts as queued once it
+    is complete on disk. Delivered messages move to sent/ until they have
+    been appended to the IMAP Sent folder, and messages the server rejects
+    for good move to failed/.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.queue_dir = self.root / "queue"
+        self.sent_dir = self.root / "sent"
+        self.failed_dir = self.root / "failed"
+        for directory in (self.queue_dir, self.sent_dir, self.failed_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+    def _write(self, path, data):
+        """Write a file so that it either appears complete or not at all"""
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _write_entry(self, entry):
+        self._write(self.queue_dir / f"{entry['id']}.json", json.dumps(entry).encode())
+
+    def enqueue(self, raw_message, sender, recipients):
+        """Add a message to the queue and return its id"""
+        # Ids sort in queue order
+        msg_id = f"{time.time_ns()}-{os.urandom(4).hex()}"
+        entry = {
+            'id': msg_id,
+            'sender': sender,
+            'recipients': list(recipients),
+            'attempts': 0,
+            'next_attempt': 0,
+            'last_error': None
+        }
+        self._write(self.queue_dir / f"{msg_id}.eml", raw_message)
+        self._write_entry(entry)
+        return msg_id
+
+    def entries(self):
+        """All queued entries, oldest first"""
+        entries = []
+        for meta_path in sorted(self.queue_dir.glob("*.json")):
+            try:
+                with open(meta_path, 'r') as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def due(self, now=None):
+        """Queued entries whose next attempt time has come"""
+        now = time.time() if now is None else now
+        return [entry for entry in self.entries() if entry['next_attempt'] <= now]
+
+    def next_due_time(self):
+        """Earliest next attempt time in the queue, or None if it is empty"""
+        times = [entry['next_attempt'] for entry in self.entries()]
+        return min(times) if times else None
+
+    def read_message(self, entry):
+        """Raw bytes of a queued message"""
+        return (self.queue_dir / f"{entry['id']}.eml").read_bytes()
+
+    def mark_sent(self, entry):
+        """Move a delivered message to sent/ to await the APPEND to Sent"""
+        os.replace(self.queue_dir / f"{entry['id']}.eml", self.sent_dir / f"{entry['id']}.eml")
+        (self.queue_dir / f"{entry['id']}.json").unlink(missing_ok=True)
+
+    def mark_failed(self, entry, error, permanent=False):
+        """Record a failed attempt and schedule a retry with exponential backoff"""
+        entry['attempts'] += 1
+        entry['last_error'] = str(error)
+        if permanent or entry['attempts'] >= OUTBOX_MAX_ATTEMPTS:
+            self._write(self.failed_dir / f"{entry['id']}.json", json.dumps(entry).encode())
+            os.replace(self.queue_dir / f"{entry['id']}.eml", self.failed_dir / f"{entry['id']}.eml")
+            (self.queue_dir / f"{entry['id']}.json").unlink(missing_ok=True)
+            return
+        self._schedule_retry(entry, entry['attempts'])
+
+    def defer(self, entry, error):
+        """Put a message back after a connection-level failure
+
+        The server never said anything about the message itself, so this
+        backs off like a failed attempt but never gives up on it.
+        """
+        entry['deferrals'] = entry.get('deferrals', 0) + 1
+        entry['last_error'] = str(error)
+        self._schedule_retry(entry, entry['deferrals'])
+
+    def _schedule_retry(self, entry, failures):
+        delay = min(OUTBOX_RETRY_DELAY * 2 ** (failures - 1), OUTBOX_MAX_RETRY_DELAY)
+        entry['next_attempt'] = time.time() + delay
+        self._write_entry(entry)
+
+    def requeue_failed(self):
+        """Move every given-up message back into the queue for a fresh set of attempts"""
+        count = 0
+        for entry in self.failed_entries():
+            entry.update(attempts=0, deferrals=0, next_attempt=0, last_error=None)
+            os.replace(self.failed_dir / f"{entry['id']}.eml", self.queue_dir / f"{entry['id']}.eml")
+            self._write_entry(entry)
+            (self.failed_dir / f"{entry['id']}.json").unlink(missing_ok=True)
+            count += 1
+        return count
+
+    def sent_ids(self):
+        """Ids of delivered messages not yet appended to Sent, oldest first"""
+        return sorted(path.stem for path in self.sent_dir.glob("*.eml"))
+
+    def read_sent(self, msg_id):
+        """Raw bytes of a delivered message awaiting APPEND"""
+        return (self.sent_dir / f"{msg_id}.eml").read_bytes()
+
+    def remove_sent(self, msg_id):
+        """Forget a delivered message once it is in the Sent folder"""
+        (self.sent_dir / f"{msg_id}.eml").unlink(missing_ok=True)
+
+    def failed_entries(self):
+        """Entries that were given up on, oldest first"""
+        entries = []
+        for meta_path in sorted(self.failed_dir.glob("*.json")):
+            try:
+                with open(meta_path, 'r') as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+
+class OutboxWorker:
+    """Deliver queued messages over a reused SMTP connection
+
+    smtp_factory returns a connected, authenticated smtplib.SMTP object and
+    imap_factory a logged-in IMAP connection used to APPEND delivered
+    messages to the folder find_sent_folder(imap) returns. All three are
+    plain callables so the worker can be pointed at local stand-in servers.
+    """
+
+    def __init__(self, outbox, smtp_factory, imap_factory=None, find_sent_folder=None):
+        self.outbox = outbox
+        self.smtp_factory = smtp_factory
+        self.imap_factory = imap_factory
+        self.find_sent_folder = find_sent_folder
+        self.smtp = None
+        self.smtp_last_used = 0
+        self.last_error = None
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+
+    def start(self):
+        """Start the delivery thread if it is not already running"""
+        if self.thread is None or not self.thread.is_alive():
+            self.stopping = False
+            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.thread.start()
+
+    def kick(self):
+        """Wake the worker up, e.g. after something was queued"""
+        self.wakeup.set()
+
+    def stop(self, timeout=10):
+        """Stop the delivery thread, anything unsent stays queued on disk
+
+        Returns False if the thread is still busy, e.g. waiting on a slow
+        server; it then closes its own connection when it gets there.
+        """
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            return not self.thread.is_alive()
+        self.close_smtp()
+        return True
+
+    def _loop(self):
+        while not self.stopping:
+            delay = self.run_once()
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+        # Only this thread touches the pooled connection while it runs
+        self.close_smtp()
+
+    def run_once(self):
+        """Send everything that is due, append to Sent, and return seconds until the next pass"""
+        entries = self.outbox.due()
+        if entries:
+            self.send_entries(entries)
+        elif self.smtp is not None and time.time() - self.smtp_last_used > SMTP_IDLE_TIMEOUT:
+            self.close_smtp()
+
+        append_ok = self.append_sent()
+
+        next_due = self.outbox.next_due_time()
+        delay = SMTP_IDLE_TIMEOUT
+        if next_due is not None:
+            delay = min(delay, max(0, next_due - time.time()))
+        if not append_ok:
+            delay = min(delay, OUTBOX_RETRY_DELAY)
+        elif self.outbox.sent_ids():
+            # More left for the next APPEND batch
+            delay = 0
+        return delay
+
+    def get_smtp(self):
+        """Return the pooled SMTP connection, reconnecting if it went stale"""
+        import smtplib
+
+        if self.smtp is not None and time.time() - self.smtp_last_used > SMTP_IDLE_TIMEOUT:
+            # Servers drop idle sessions, check before trusting it
+            try:
+                if self.smtp.noop()[0] != 250:
+                    self.close_smtp()
+            except (smtplib.SMTPException, OSError):
+                self.close_smtp()
+        if self.smtp is None:
+            self.smtp = self.smtp_factory()
+        self.smtp_last_used = time.time()
+        return self.smtp
+
+    def close_smtp(self):
+        """Log out of the pooled SMTP connection"""
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+    def send_entries(self, entries):
+        """Send a batch of queued messages over one connection"""
+        import smtplib
+
+        try:
+            smtp = self.get_smtp()
+        except Exception as e:
+            self.last_error = f"SMTP connection failed: {str(e)}"
+            for entry in entries:
+                self.outbox.defer(entry, self.last_error)
+            return
+
+        handled = set()
+        try:
+            if smtp.has_extn('pipelining'):
+                self.send_pipelined(smtp, entries, handled)
+            else:
+                self.send_sequential(smtp, entries, handled)
+        except (smtplib.SMTPException, OSError) as e:
+            # Whatever this batch did not get to goes back with a delay
+            self.last_error = f"SMTP session failed: {str(e)}"
+            self.close_smtp()
+            for entry in entries:
+                if entry['id'] not in handled:
+                    self.outbox.defer(entry, self.last_error)
+        self.smtp_last_used = time.time()
+
+    def send_sequential(self, smtp, entries, handled):
+        """Send messages one transaction at a time on a server without PIPELINING"""
+        import smtplib
+
+        for entry in entries:
+            try:
+                refused = smtp.sendmail(entry['sender'], entry['recipients'], self.outbox.read_message(entry))
+                if refused:
+                    self.last_error = f"Some recipients were refused: {', '.join(refused)}"
+                self.outbox.mark_sent(entry)
+                handled.add(entry['id'])
+            except smtplib.SMTPRecipientsRefused as e:
+                self.outbox.mark_failed(entry, f"All recipients refused: {e.recipients}", permanent=True)
+                handled.add(entry['id'])
+                smtp.rset()
+            except smtplib.SMTPResponseException as e:
+                self.outbox.mark_failed(entry, f"{e.smtp_code} {e.smtp_error!r}", permanent=e.smtp_code >= 500)
+                handled.add(entry['id'])
+                smtp.rset()
+
+    def send_pipelined(self, smtp, entries, handled):
+        """Send messages with RFC 2920 PIPELINING, one round trip per message
+
+        Each group written to the server carries the previous message's
+        content followed by the next message's MAIL, RCPT and DATA commands.
+        """
+        current = None      # entry whose DATA got 354 and whose content is sent next
+        need_rset = False
+
+        for entry in entries + [None]:
+            group = []
+            if current is not None:
+                group.append(self.dot_stuff(self.outbox.read_message(current)))
+            if need_rset:
+                group.append(b"RSET\r\n")
+            if entry is not None:
+                group.append(f"MAIL FROM:<{entry['sender']}>\r\n".encode())
+                for recipient in entry['recipients']:
+                    group.append(f"RCPT TO:<{recipient}>\r\n".encode())
+                group.append(b"DATA\r\n")
+            smtp.send(b"".join(group))
+
+            # Replies come back in the order the commands were sent
+            if current is not None:
+                code, resp = smtp.getreply()
+                if code == 250:
+                    self.outbox.mark_sent(current)
+                else:
+                    self.outbox.mark_failed(current, f"{code} {resp!r}", permanent=code >= 500)
+                handled.add(current['id'])
+                current = None
+            if need_rset:
+                smtp.getreply()
+                need_rset = False
+            if entry is None:
+                break
+
+            mail_code, mail_resp = smtp.getreply()
+            rcpt_replies = [smtp.getreply() for _ in entry['recipients']]
+            data_code, data_resp = smtp.getreply()
+
+            if data_code == 354:
+                refused = [r for r, (code, _) in zip(entry['recipients'], rcpt_replies) if code not in (250, 251)]
+                if refused:
+                    self.last_error = f"Some recipients were refused: {', '.join(refused)}"
+                current = entry
+                continue
+
+            # The transaction did not start, find the reply that explains why
+            if mail_code != 250:
+                code, resp = mail_code, mail_resp
+            else:
+                code, resp = next(((c, r) for c, r in rcpt_replies if c not in (250, 251)), (data_code, data_resp))
+            self.outbox.mark_failed(entry, f"{code} {resp!r}", permanent=code >= 500)
+            handled.add(entry['id'])
+            need_rset = True
+
+    def dot_stuff(self, raw_message):
+        """Prepare message content for the DATA phase"""
+        data = re.sub(rb'(?:\r\n|\n|\r(?!\n))', b"\r\n", raw_message)
+        data = re.sub(rb'(?m)^\.', b"..", data)
+        if not data.endswith(b"\r\n"):
+            data += b"\r\n"
+        return data + b".\r\n"
+
+    def append_sent(self):
+        """APPEND a batch of delivered messages to the Sent folder, return False on failure"""
+        msg_ids = self.outbox.sent_ids()[:SENT_APPEND_BATCH]
+        if not msg_ids:
+            return True
+        if self.imap_factory is None:
+            # No IMAP side at all, the SMTP delivery is all there is
+            for msg_id in msg_ids:
+                self.outbox.remove_sent(msg_id)
+            return True
+
+        import imaplib
+        import socket
+
+        try:
+            imap = self.imap_factory()
+        except Exception as e:
+            self.last_error = f"Could not connect to save sent mail: {str(e)}"
+            return False
+            
+        # imaplib writes a literal and its closing CRLF separately, without
+        # this Nagle holds back every APPEND for a delayed ACK
+        try:
+            imap.socket().setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (AttributeError, OSError):
+            pass
+
+        sent_folder = None
+        try:
+            # Looked up per pass, the folder layout may not have been known
+            # when the worker started
+            sent_folder = self.find_sent_folder(imap) if self.find_sent_folder else None
+            if sent_folder is None:
+                # The account has no Sent folder, nowhere to file them
+                for msg_id in msg_ids:
+                    self.outbox.remove_sent(msg_id)
+                return True
+                
+            for msg_id in msg_ids:
+                status, data = imap.append(sent_folder, '(\\Seen)',
+                                           imaplib.Time2Internaldate(time.time()),
+                                           self.outbox.read_sent(msg_id))
+                if status != 'OK':
+                    self.last_error = f"Saving to {sent_folder} failed: {data}"
+                    return False
+                self.outbox.remove_sent(msg_id)
+            return True
+        except Exception as e:
+            self.last_error = f"Saving to {sent_folder or 'Sent'} failed: {str(e)}"
+            return False
+        finally:
+            try:
+                imap.logout()
+            except Exception:
+                pass
+
+
+class MessageStore:
+    """Content-addressed local copy of downloaded messages, shared by all folders
+
+    Each message is stored once under objects/, keyed by its X-GM-MSGID on
+    servers that have one, otherwise by a hash of its Message-ID, sender
+    headers and body, or of the whole message if it has no Message-ID.
+    Folders only hold references (folder, UIDVALIDITY, UID -> key), so the
+    same message seen under several folders or Gmail labels is downloaded
+    and stored once. Before downloading, a message is looked up by an
+    identity that is known from a cheap header fetch: the X-GM-MSGID, or
+    the Message-ID together with RFC822.SIZE.
+
+    The index is an append-only journal (index.jsonl) that is replayed on
+    load, so recording a batch never rewrites the whole index.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.root / "index.jsonl"
+        self.identities = {}    # identity -> key
+        self.folders = {}       # folder -> {'uidvalidity': n, 'uids': {uid: key}}
+        self.pending = []       # journal records not yet written
+        self.load_index()
+
+    def load_index(self):
+        """Replay the index journal"""
+        if not self.index_file.exists():
+            return
+        with open(self.index_file, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from an interrupted write
+                    continue
+                self._apply(record)
+
+    def _apply(self, record):
+        if record.get('identity'):
+            self.identities[record['identity']] = record['key']
+        if record.get('folder') is not None:
+            folder = self.folders.get(record['folder'])
+            if folder is None or folder['uidvalidity'] != record['uidvalidity']:
+                # A new UIDVALIDITY invalidates every UID we knew for the folder
+                folder = self.folders[record['folder']] = {'uidvalidity': record['uidvalidity'], 'uids': {}}
+            folder['uids'][record['uid']] = record['key']
+
+    def _record(self, record):
+        self._apply(record)
+        self.pending.append(record)
+
+    def flush(self):
+        """Write pending index records to the journal"""
+        if not self.pending:
+            return
+        with open(self.index_file, 'a') as f:
+            f.write("".join(json.dumps(record) + "\n" for record in self.pending))
+        self.pending = []
+
+    def identity(self, message_id, size, gm_msgid=None):
+        """Identity to look a message up by before downloading it, or None if it has none"""
+        if gm_msgid:
+            return f"gm:{gm_msgid}"
+        if message_id:
+            return f"mid:{message_id}:{size}"
+        return None
+
+    def content_key(self, raw_message, message_id=None, gm_msgid=None):
+        """Key a downloaded message is stored under"""
+        import hashlib
+
+        from email.parser import BytesHeaderParser
+
+        if gm_msgid:
+            return f"gm{gm_msgid}"
+        if not message_id:
+            # Nothing to tell copies apart by, so only byte-identical messages share a key
+            return hashlib.sha256(raw_message).hexdigest()
+        # Trace headers differ between copies of one message, so only key on the ones the sender wrote
+        headers = BytesHeaderParser().parsebytes(raw_message)
+        fields = [message_id] + [str(headers.get(name, "")) for name in ('From', 'To', 'Cc', 'Date', 'Subject')]
+        body = re.split(rb'\r?\n\r?\n', raw_message, maxsplit=1)[-1]
+        digest = hashlib.sha256("\0".join(fields).encode('utf-8', errors='replace') + b"\0" + hashlib.sha256(body).digest())
+        return digest.hexdigest()
+
+    def object_path(self, key):
+        """Where a stored message lives on disk"""
+        return self.objects_dir / key[-2:] / f"{key}.eml"
+
+    def folder_refs(self, folder, uidvalidity):
+        """UID -> key for a folder, empty if UIDVALIDITY changed since we saw it"""
+        refs = self.folders.get(folder)
+        if refs is None or refs['uidvalidity'] != uidvalidity:
+            return {}
+        return refs['uids']
+
+    def find(self, identity):
+        """Key of a stored message with this identity, or None"""
+        key = self.identities.get(identity) if identity else None
+        if key and self.object_path(key).exists():
+            return key
+        return None
+
+    def add(self, raw_message, message_id, gm_msgid, identity, folder, uidvalidity, uid):
+        """Store a downloaded message (once) and reference it from a folder, return its key"""
+        key = self.content_key(raw_message, message_id, gm_msgid)
+        path = self.object_path(key)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            tmp_path = path.with_name(path.name + ".tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(raw_message)
+            os.replace(tmp_path, path)
+        self._record({'identity': identity, 'key': key, 'folder': folder, 'uidvalidity': uidvalidity, 'uid': uid})
+        return key
+
+    def link(self, key, folder, uidvalidity, uid):
+        """Reference an already stored message from another folder"""
+        if self.folder_refs(folder, uidvalidity).get(uid) != key:
+            self._record({'key': key, 'folder': folder, 'uidvalidity': uidvalidity, 'uid': uid})
+
+    def read(self, key):
+        """Raw bytes of a stored message"""
+        return self.object_path(key).read_bytes()
+
+
+class MailboxStats:
+    """Header metadata for one folder stored as NumPy columns
+
+    uids, timestamps (seconds since the epoch, -1 when the Date header is
+    missing or unparseable), sender_ids (index into senders) and sizes
+    (RFC822.SIZE) are parallel arrays, so every summary below is a handful
+    of vectorized operations rather than a loop over messages.
+    """
+
+    def __init__(self, uids, timestamps, sender_ids, sizes, senders):
+        import numpy as np
+
+        self.uids = np.asarray(uids, dtype=np.int64)
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.sender_ids = np.asarray(sender_ids, dtype=np.int32)
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        self.senders = list(senders)
+
+    def __len__(self):
+        return len(self.uids)
+
+    def top_senders(self, n=10):
+        """The n senders with the most messages, as (address, messages, bytes)"""
+        import numpy as np
+
+        counts = np.bincount(self.sender_ids, minlength=len(self.senders))
+        total_bytes = np.bincount(self.sender_ids, weights=self.sizes, minlength=len(self.senders))
+        n = min(n, len(counts))
+        if n == 0:
+            return []
+        top = np.argpartition(counts, -n)[-n:]
+        top = top[np.argsort(counts[top])[::-1]]
+        return [(self.senders[i], int(counts[i]), int(total_bytes[i])) for i in top]
+
+    def _local_days(self, utc_offset):
+        """Day numbers in local time for messages with a usable date"""
+        return (self.timestamps[self.timestamps >= 0] + utc_offset) // 86400
+
+    def volume_per_day(self, utc_offset=0):
+        """Messages per calendar day, as (first day timestamp, counts for every day from there)"""
+        import numpy as np
+
+        days = self._local_days(utc_offset)
+        if len(days) == 0:
+            return 0, np.zeros(0, dtype=np.int64)
+        first = days.min()
+        return int(first * 86400 - utc_offset), np.bincount(days - first)
+
+    def hour_histogram(self, utc_offset=0):
+        """Messages per hour of the day (0-23)"""
+        import numpy as np
+
+        valid = self.timestamps[self.timestamps >= 0]
+        return np.bincount(((valid + utc_offset) // 3600) % 24, minlength=24)
+
+    def weekday_histogram(self, utc_offset=0):
+        """Messages per weekday, Monday first"""
+        import numpy as np
+
+        days = self._local_days(utc_offset)
+        # 1970-01-01 was a Thursday
+        return np.bincount((days + 3) % 7, minlength=7)
+
+    def size_distribution(self):
+        """Size percentiles plus counts per power-of-two size bucket"""
+        import numpy as np
+
+        if len(self.sizes) == 0:
+            return {}, np.zeros(0, dtype=np.int64)
+        p50, p90, p99 = np.percentile(self.sizes, [50, 90, 99])
+        summary = {
+            'total': int(self.sizes.sum()),
+            'mean': float(self.sizes.mean()),
+            'median': float(p50),
+            'p90': float(p90),
+            'p99': float(p99),
+            'max': int(self.sizes.max())
+        }
+        # Bucket k holds sizes in [2**k, 2**(k+1))
+        buckets = np.bincount(np.log2(np.maximum(self.sizes, 1)).astype(np.int64))
+        return summary, buckets
+
+    def largest(self, n=10):
+        """UIDs and sizes of the n largest messages, biggest first"""
+        import numpy as np
+
+        n = min(n, len(self.sizes))
+        if n == 0:
+            return []
+        top = np.argpartition(self.sizes, -n)[-n:]
+        top = top[np.argsort(self.sizes[top])[::-1]]
+        return [(int(self.uids[i]), int(self.sizes[i])) for i in top]
+
 
 class EmailBrowser:
     def __init__(self):
@@ -38,6 +742,7 @@ class EmailBrowser:
         self.messages = []
         self.current_index = 0
         self.total_messages = 0
+        self.uidvalidity = None
         self.folders = []
         
         # Initialize with default settings
@@ -50,9 +755,28 @@ class EmailBrowser:
         self.config_dir = Path.home() / ".email_browser"
         self.config_dir.mkdir(exist_ok=True)
         self.config_file = self.config_dir / "accounts.txt"
+        self.cache_file = self.config_dir / "account_cache.json"
         
         # Load saved accounts
         self.saved_accounts = self.load_saved_accounts()
+        
+        # Per-account CAPABILITY and special-use folder cache
+        self.account_cache = self.load_account_cache()
+        self.capabilities = set()
+        self.special_folders = {}
+        
+        # Connection opened while the password prompt is on screen
+        self.pending_connect = None
+        
+        # Outgoing mail, set up per account once connected
+        self.smtp_server = None
+        self.smtp_port = DEFAULT_SMTP_PORT
+        self.outbox = None
+        self.outbox_worker = None
+        
+        # Local copies of downloaded messages, set up per account once connected
+        self.store = None
+        self.store_hits = 0
 
     def load_saved_accounts(self):
         """Load saved email accounts from config file"""
@@ -60,25 +784,17 @@ class EmailBrowser:
         
         if self.config_file.exists():
             try:
-                with open(self.config_file, 'r') as f:
-                    lines = f.readlines()
-                    
-                i = 0
-                while i < len(lines):
-                    if i + 3 < len(lines):  # Need at least 4 lines for a complete account
-                        name = lines[i].strip()
-                        server = lines[i+1].strip()
-                        port = int(lines[i+2].strip())
-                        user = lines[i+3].strip()
-                        
-                        accounts.append({
-                            'name': name,
-                            'server': server,
-                            'port': port,
-                            'user': user
-                        })
-                        
-                    i += 5  # Skip the separator line
+                lines = self.config_file.read_text().splitlines()
+                
+                # Each account is 4 lines followed by a separator line
+                for i in range(0, len(lines) - 3, 5):
+                    name, server, port, user = (line.strip() for line in lines[i:i+4])
+                    accounts.append({
+                        'name': name,
+                        'server': server,
+                        'port': int(port),
+                        'user': user
+                    })
             except Exception as e:
                 print(f"Error loading saved accounts: {str(e)}")
                 
@@ -92,15 +808,53 @@ class EmailBrowser:
                 f.write(f"{server}\n")
                 f.write(f"{port}\n")
                 f.write(f"{user}\n")
-                f.write("-" * 30 + "\n")
+                f.write(ACCOUNT_SEPARATOR + "\n")
                 
-            # Reload saved accounts
-            self.saved_accounts = self.load_saved_accounts()
+            # No need to reparse the file, it only grew by this entry
+            self.saved_accounts.append({
+                'name': name,
+                'server': server,
+                'port': int(port),
+                'user': user
+            })
             return True
         except Exception as e:
             print(f"Error saving account: {str(e)}")
             return False
             
+    def load_account_cache(self):
+        """Load cached capabilities and special-use folders for all accounts"""
+        if not self.cache_file.exists():
+            return {}
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading account cache: {str(e)}")
+            return {}
+            
+    def save_account_cache(self):
+        """Write the account cache back to disk"""
+        try:
+            tmp_file = self.cache_file.with_suffix('.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump(self.account_cache, f, indent=2)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            print(f"Error saving account cache: {str(e)}")
+            
+    def account_key(self):
+        """Key identifying the current account in the cache"""
+        return f"{self.email_user}@{self.imap_server}:{self.imap_port}"
+        
+    def account_dir_name(self):
+        """Directory name for per-account data"""
+        return "".join(c if c.isalnum() or c in "._-@" else "_" for c in self.account_key())
+        
+    def start_background_connect(self):
+        """Start connecting to the configured server while the user is still typing"""
+        self.pending_connect = BackgroundConnect(self.imap_server, self.imap_port)
+            
     def configure_connection(self):
         """Configure email connection settings"""
         os.system('cls' if os.name == 'nt' else 'clear')
@@ -127,6 +881,7 @@ class EmailBrowser:
                     self.imap_server = account['server']
                     self.imap_port = account['port']
                     self.email_user = account['user']
+                    self.start_background_connect()
                     self.email_password = input(f"Enter password for {self.email_user}: ")
                     return True
                 elif choice == len(self.saved_accounts)+1:
@@ -161,6 +916,9 @@ class EmailBrowser:
                 print(f"Invalid port number, using default: {DEFAULT_IMAP_PORT}")
                 self.imap_port = DEFAULT_IMAP_PORT
                 
+        # Server is known now, so connect while username and password are typed
+        self.start_background_connect()
+                
         user = input(f"Email Username [{DEFAULT_EMAIL_USER}]: ")
         if user:
             self.email_user = user
@@ -168,6 +926,20 @@ class EmailBrowser:
         password = input("Email Password (leave empty for default): ")
         if password:
             self.email_password = password
+            
+        smtp_default = self.default_smtp_server()
+        smtp_server = input(f"SMTP Server [{smtp_default}]: ")
+        smtp_port_str = input(f"SMTP Port [{DEFAULT_SMTP_PORT}]: ")
+        if smtp_server or smtp_port_str:
+            smtp_port = DEFAULT_SMTP_PORT
+            if smtp_port_str:
+                try:
+                    smtp_port = int(smtp_port_str)
+                except ValueError:
+                    print(f"Invalid port number, using default: {DEFAULT_SMTP_PORT}")
+            cache = self.account_cache.setdefault(self.account_key(), {})
+            cache['smtp'] = [smtp_server or smtp_default, smtp_port]
+            self.save_account_cache()
         
         # Ask if user wants to save these settings
         save = input("\nSave these settings for future use? (y/n): ").lower()
@@ -181,14 +953,122 @@ class EmailBrowser:
 
     def connect(self):
         """Connect to the email server"""
+        import imaplib
+        
         try:
-            self.mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
-            self.mail.login(self.email_user, self.email_password)
+            conn = None
+            if self.pending_connect:
+                pending, self.pending_connect = self.pending_connect, None
+                conn = pending.result(self.imap_server, self.imap_port)
+                
+            if conn is None:
+                conn = imaplib.IMAP4_SSL(self.imap_server, self.imap_port, timeout=IMAP_TIMEOUT)
+                status, data = conn.login(self.email_user, self.email_password)
+            else:
+                try:
+                    status, data = conn.login(self.email_user, self.email_password)
+                except (imaplib.IMAP4.abort, OSError):
+                    # The early connection may have been idle too long, start over once
+                    conn = imaplib.IMAP4_SSL(self.imap_server, self.imap_port, timeout=IMAP_TIMEOUT)
+                    status, data = conn.login(self.email_user, self.email_password)
+                
+            self.mail = conn
+            self.load_capabilities(data)
+            self.setup_outbox()
+            self.store = MessageStore(self.config_dir / "store" / self.account_dir_name())
             print(f"✅ Successfully connected to {self.imap_server} as {self.email_user}")
             return True
         except Exception as e:
             print(f"❌ Connection failed: {str(e)}")
             return False
+            
+    def new_imap_connection(self, server, port, user, password):
+        """Open a separate logged-in IMAP connection"""
+        import imaplib
+        
+        conn = imaplib.IMAP4_SSL(server, port, timeout=IMAP_TIMEOUT)
+        conn.login(user, password)
+        return conn
+        
+    def reconnect(self):
+        """Log in again after the connection dropped and reselect the folder
+        
+        Returns False if the server could not be reached, or if the folder's
+        UIDVALIDITY changed so UIDs from before the drop no longer apply.
+        """
+        import imaplib
+        
+        print("🔌 Connection lost, reconnecting...")
+        error = None
+        for attempt in range(RECONNECT_ATTEMPTS):
+            if attempt:
+                time.sleep(RECONNECT_DELAY * 2 ** (attempt - 1))
+            try:
+                self.mail.shutdown()
+            except Exception:
+                pass
+            try:
+                self.mail = self.new_imap_connection(self.imap_server, self.imap_port, self.email_user, self.email_password)
+                if self.selected_folder:
+                    status, data = self.mail.select(self.quote_folder(self.selected_folder))
+                    if status != 'OK':
+                        print(f"❌ Failed to reselect folder '{self.selected_folder}'")
+                        return False
+                    self.total_messages = int(data[0])
+                    self.mail.response('EXISTS')
+                    uidvalidity = self.read_uidvalidity()
+                    if uidvalidity != self.uidvalidity:
+                        print(f"⚠️ Folder '{self.selected_folder}' changed on the server, reload it to continue")
+                        self.uidvalidity = uidvalidity
+                        return False
+                print("✅ Reconnected")
+                return True
+            except (imaplib.IMAP4.error, OSError) as e:
+                error = e
+                
+        print(f"❌ Reconnect failed: {str(error)}")
+        return False
+        
+    def imap_call(self, command, *args):
+        """Run an IMAP command, reconnecting and retrying once if the connection dropped"""
+        import imaplib
+        
+        try:
+            return getattr(self.mail, command)(*args)
+        except (imaplib.IMAP4.abort, OSError):
+            if not self.reconnect():
+                raise
+            return getattr(self.mail, command)(*args)
+            
+    def load_capabilities(self, login_data):
+        """Work out post-login capabilities, asking the server only if nothing is known"""
+        cache = self.account_cache.setdefault(self.account_key(), {})
+        
+        # Most servers include the new list in the login response
+        match = CAPABILITY_CODE_RE.search(login_data[0] or b'') if login_data else None
+        if match:
+            capabilities = match.group(1).decode(errors='ignore').upper().split()
+        elif 'capabilities' in cache:
+            capabilities = cache['capabilities']
+        else:
+            # imaplib only holds the pre-login list, which can lack extensions
+            # such as X-GM-EXT-1, so ask once and cache the answer
+            status, data = self.mail.capability()
+            if status == 'OK' and data and data[0]:
+                capabilities = data[0].decode(errors='ignore').upper().split()
+            else:
+                capabilities = list(self.mail.capabilities)
+            
+        self.capabilities = set(capabilities)
+        self.special_folders = dict(cache.get('special_folders', {}))
+        
+        if cache.get('capabilities') != sorted(self.capabilities):
+            cache['capabilities'] = sorted(self.capabilities)
+            self.save_account_cache()
+            
+    def has_capability(self, name):
+        """Check whether the server advertised a capability"""
+        return name.upper() in self.capabilities
 
     def get_folders(self):
         """Get all available folders/mailboxes"""
@@ -196,16 +1076,84 @@ class EmailBrowser:
             print("Not connected to server")
             return []
             
-        status, response = self.mail.list()
+        status, response = self.imap_call('list')
         if status != 'OK':
             print("Failed to retrieve folders")
             return []
             
-        self.folders = []
-        for folder in response:
-            folder_name = folder.decode().split('"/"')[-1].strip().strip('"')
-            self.folders.append(folder_name)
+        self.folders, special_folders = self.parse_folder_list(response)
+        
+        self.special_folders = special_folders
+        cache = self.account_cache.setdefault(self.account_key(), {})
+        if cache.get('special_folders') != special_folders:
+            cache['special_folders'] = special_folders
+            self.save_account_cache()
         return self.folders
+        
+    def parse_folder_list(self, response):
+        """Folder names and special-use mapping from a LIST response"""
+        folders = []
+        special_folders = {}
+        for folder in response:
+            line = folder.decode(errors='ignore')
+            match = LIST_RESPONSE_RE.match(line)
+            if match:
+                folder_name = match.group('name').strip().strip('"')
+                flags = match.group('flags').split()
+            else:
+                folder_name = line.split('"/"')[-1].strip().strip('"')
+                flags = []
+            folders.append(folder_name)
+            
+            for flag in flags:
+                # Flags are case-insensitive, e.g. \Sent vs \SENT
+                flag = '\\' + flag.lstrip('\\').capitalize()
+                if flag in SPECIAL_USE_FLAGS:
+                    special_folders.setdefault(flag, folder_name)
+                    
+        # Servers without SPECIAL-USE usually still call it "Sent"
+        if '\\Sent' not in special_folders and 'Sent' in folders:
+            special_folders['\\Sent'] = 'Sent'
+            
+        return folders, special_folders
+        
+    def find_sent_folder(self, imap, special_folders):
+        """Quoted Sent folder to APPEND to, or None if the account has none
+        
+        Runs on the outbox worker with its own connection, so when
+        special_folders doesn't know the Sent folder it asks the server there.
+        """
+        sent_folder = special_folders.get('\\Sent')
+        if sent_folder is None:
+            status, response = imap.list()
+            if status != 'OK':
+                raise RuntimeError("LIST failed")
+            folders, special_folders = self.parse_folder_list(response)
+            sent_folder = special_folders.get('\\Sent')
+        return self.quote_folder(sent_folder) if sent_folder else None
+        
+    def select_default_folder(self):
+        """Select the Sent folder if the account has one, otherwise INBOX"""
+        cache = self.account_cache.get(self.account_key(), {})
+        if 'special_folders' not in cache:
+            # First login with this account, learn the folder layout once
+            self.get_folders()
+            
+        sent_folder = self.special_folders.get('\\Sent')
+        if sent_folder:
+            if self.select_folder(sent_folder):
+                return True
+            # Cached mapping is stale, relearn it next time
+            cache.pop('special_folders', None)
+            self.save_account_cache()
+            
+        return self.select_folder("INBOX")
+
+    def quote_folder(self, folder_name):
+        """Quote a folder name for use in an IMAP command"""
+        if folder_name.startswith('"') or not any(c in folder_name for c in ' ()%*"\\'):
+            return folder_name
+        return '"' + folder_name.replace('\\', '\\\\').replace('"', '\\"') + '"'
 
     def select_folder(self, folder_name="INBOX"):
         """Select a specific folder/mailbox"""
@@ -214,33 +1162,54 @@ class EmailBrowser:
             return False
             
         try:
-            status, data = self.mail.select(folder_name)
+            status, data = self.imap_call('select', self.quote_folder(folder_name))
             if status != 'OK':
                 print(f"❌ Failed to select folder '{folder_name}'")
                 return False
                 
             self.selected_folder = folder_name
             self.total_messages = int(data[0])
+            self.mail.response('EXISTS')  # Already counted, so update_message_count only sees later changes
+            self.uidvalidity = self.read_uidvalidity()
             print(f"📁 Selected folder: {folder_name} ({self.total_messages} messages)")
             return True
         except Exception as e:
             print(f"❌ Error selecting folder: {str(e)}")
             return False
 
-    def fetch_message_ids(self, limit=None, criteria="ALL"):
-        """Fetch message IDs based on criteria"""
+    def read_uidvalidity(self):
+        """UIDVALIDITY reported by the last SELECT"""
+        status, data = self.mail.response('UIDVALIDITY')
+        if data and data[-1] is not None:
+            return int(data[-1])
+        return None
+        
+    def fetch_message_ids(self, limit=None, criteria="ALL", uid=False):
+        """Fetch message IDs (or UIDs) based on criteria"""
         if not self.mail or not self.selected_folder:
             print("Not connected or no folder selected")
             return []
             
+        # SELECT already told us how many messages there are, skip the SEARCH
+        if criteria == "ALL" and not uid and self.update_message_count():
+            first = 1
+            if limit and limit < self.total_messages:
+                first = self.total_messages - limit + 1
+            return [str(num).encode() for num in range(first, self.total_messages + 1)]
+            
         try:
-            status, data = self.mail.search(None, criteria)
+            if uid:
+                status, data = self.imap_call('uid', 'SEARCH', None, criteria)
+            else:
+                status, data = self.imap_call('search', None, criteria)
             if status != 'OK':
                 print("Failed to fetch message IDs")
                 return []
                 
             # Get all message IDs
             msg_ids = data[0].split()
+            if criteria == "ALL" and not uid:
+                self.total_messages = len(msg_ids)
             
             # Apply limit if specified
             if limit and limit < len(msg_ids):
@@ -250,6 +1219,226 @@ class EmailBrowser:
         except Exception as e:
             print(f"Error fetching message IDs: {str(e)}")
             return []
+            
+    def update_message_count(self):
+        """Pick up EXISTS and EXPUNGE updates the server sent along with earlier responses
+        
+        Returns False if the count can't be trusted: imaplib doesn't keep
+        the order untagged responses arrived in, so when both kinds came in
+        we can't tell whether the EXISTS already accounts for the expunges.
+        """
+        status, exists = self.mail.response('EXISTS')
+        status, expunged = self.mail.response('EXPUNGE')
+        exists = [count for count in exists if count is not None]
+        expunged = [num for num in expunged if num is not None]
+        if exists and expunged:
+            return False
+        if exists:
+            self.total_messages = int(exists[-1])
+        elif expunged:
+            self.total_messages = max(self.total_messages - len(expunged), 0)
+        return True
+            
+    def check_new_messages(self):
+        """Ask the server whether new messages arrived in the selected folder"""
+        try:
+            self.imap_call('noop')
+        except Exception as e:
+            print(f"Error checking for new messages: {str(e)}")
+            
+    def uids_after(self, last_uid):
+        """UIDs in the selected folder above last_uid, oldest first"""
+        status, data = self.imap_call('uid', 'SEARCH', None, f"UID {last_uid + 1}:*")
+        if status != 'OK':
+            return []
+        # "n:*" still matches the newest message when n is past the end
+        return [uid for uid in data[0].split() if int(uid) > last_uid]
+        
+    def format_id_set(self, msg_ids):
+        """Turn ascending message ids into an IMAP sequence set, e.g. 1:200,205"""
+        ranges = []
+        for msg_id in (int(msg_id) for msg_id in msg_ids):
+            if ranges and msg_id == ranges[-1][1] + 1:
+                ranges[-1][1] = msg_id
+            else:
+                ranges.append([msg_id, msg_id])
+        return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+        
+    def fetch_in_batches(self, msg_ids, items, uid=False, batch_size=None):
+        """Fetch messages in batches, resuming after a dropped connection
+        
+        items must include UID. Yields one list of (uid, meta, data) tuples
+        per batch, where meta is the rest of the FETCH response, e.g.
+        b'12 (UID 40 RFC822.SIZE 2048 BODY[] {2048}'. If the connection
+        drops, the batch in flight is fetched again after reconnecting; once
+        a batch has completed, sequence numbers are swapped for the UIDs
+        after the last completed one, since those stay valid across
+        sessions. If the server answers NO, e.g. because a message in the
+        batch was expunged, the messages it did send are still returned
+        and the rest are reported.
+        """
+        import imaplib
+        
+        batch_size = batch_size or FETCH_BATCH_SIZE
+        pending = list(msg_ids)
+        last_uid = None
+        failures = 0
+        while pending:
+            batch = pending[:batch_size]
+            id_list = self.format_id_set(batch)
+            while len(id_list) > MAX_ID_SET_LENGTH and len(batch) > 1:
+                # Scattered ids don't collapse into ranges, send fewer at a time
+                batch = batch[:len(batch) // 2]
+                id_list = self.format_id_set(batch)
+            try:
+                if uid:
+                    status, msg_data = self.mail.uid('FETCH', id_list, items)
+                else:
+                    status, msg_data = self.mail.fetch(id_list, items)
+            except (imaplib.IMAP4.abort, OSError):
+                failures += 1
+                if failures > RECONNECT_ATTEMPTS or not self.reconnect():
+                    print(f"❌ Stopped with {len(pending)} messages left to fetch")
+                    return
+                if not uid and last_uid is not None:
+                    pending = self.uids_after(last_uid)[:len(pending)]
+                    uid = True
+                continue
+                
+            pending = pending[len(batch):]
+            failures = 0
+            partial = status != 'OK'
+            if partial:
+                # A NO still leaves whatever the server could read in the untagged responses
+                reason = msg_data[0].decode(errors='replace') if msg_data and msg_data[0] else status
+                status, msg_data = self.mail.response('FETCH')
+                msg_data = [item for item in msg_data if item is not None]
+                
+            results = []
+            for i, item in enumerate(msg_data):
+                # Each message arrives as (b'<num> (UID <uid> ... {size}', data) followed by b')'
+                if not isinstance(item, tuple):
+                    continue
+                meta = item[0]
+                if i + 1 < len(msg_data) and isinstance(msg_data[i + 1], bytes):
+                    # Some servers send UID and other items after the literal
+                    meta += msg_data[i + 1]
+                match = re.search(rb'UID (\d+)', meta)
+                results.append((int(match.group(1)) if match else None, meta, item[1]))
+                
+            uids = [msg_uid for msg_uid, meta, data in results if msg_uid is not None]
+            if uids:
+                last_uid = max(uids)
+            if partial:
+                # Sequence numbers come first in each response, UIDs inside it
+                arrived = set(uids) if uid else {int(meta.split()[0]) for msg_uid, meta, data in results}
+                lost = [msg_id for msg_id in batch if int(msg_id) not in arrived]
+                if lost:
+                    kind = "UIDs" if uid else "messages"
+                    print(f"⚠️ Server could not return {len(lost)} messages ({kind} {self.format_id_set(lost)}): {reason}")
+            yield results
+            
+    def fetch_stored(self, msg_ids, uid=False, stop_at_gap=False):
+        """Fetch messages through the local store, downloading only those it lacks
+        
+        A small header fetch identifies each message first. Messages this
+        folder already references, or that were downloaded under another
+        folder, are read from the store; the rest are fetched with
+        BODY.PEEK[] and added to it. Yields one list of (uid, raw message)
+        pairs per batch. Messages whose body didn't arrive are left out and
+        counted; with stop_at_gap, fetching instead stops before the first
+        of them so a caller saving its progress by UID can't skip one.
+        """
+        gmail = self.has_capability('X-GM-EXT-1')
+        items = "(UID RFC822.SIZE X-GM-MSGID BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])" if gmail else \
+            "(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])"
+        folder, uidvalidity = self.selected_folder, self.uidvalidity
+        
+        for batch in self.fetch_in_batches(msg_ids, items, uid):
+            wanted = []
+            for msg_uid, meta, header_data in batch:
+                message_id = self.parse_header_fields(header_data).get('message-id')
+                size_match = re.search(rb'RFC822\.SIZE (\d+)', meta)
+                gm_match = re.search(rb'X-GM-MSGID (\d+)', meta)
+                gm_msgid = gm_match.group(1).decode() if gm_match else None
+                identity = self.store.identity(message_id, size_match.group(1).decode() if size_match else "", gm_msgid)
+                
+                key = self.store.folder_refs(folder, uidvalidity).get(msg_uid)
+                if not key or not self.store.object_path(key).exists():
+                    key = self.store.find(identity)
+                wanted.append((msg_uid, key, message_id, gm_msgid, identity))
+                
+            downloaded = {}
+            missing = [msg_uid for msg_uid, key, *rest in wanted if key is None and msg_uid is not None]
+            if missing:
+                for body_batch in self.fetch_in_batches(missing, "(UID BODY.PEEK[])", uid=True):
+                    for msg_uid, meta, raw_email in body_batch:
+                        downloaded[msg_uid] = raw_email
+                        
+            not_downloaded = [msg_uid for msg_uid in missing if msg_uid not in downloaded]
+            if not_downloaded:
+                print(f"⚠️ {len(not_downloaded)} messages could not be downloaded")
+            cutoff = min(not_downloaded) if not_downloaded and stop_at_gap else None
+            
+            results = []
+            for msg_uid, key, message_id, gm_msgid, identity in wanted:
+                if cutoff is not None and (msg_uid is None or msg_uid >= cutoff):
+                    continue
+                if key is not None:
+                    self.store.link(key, folder, uidvalidity, msg_uid)
+                    results.append((msg_uid, self.store.read(key)))
+                    self.store_hits += 1
+                elif msg_uid in downloaded:
+                    raw_email = downloaded[msg_uid]
+                    self.store.add(raw_email, message_id, gm_msgid, identity, folder, uidvalidity, msg_uid)
+                    results.append((msg_uid, raw_email))
+            self.store.flush()
+            
+            yield results
+            if cutoff is not None:
+                return
+            
+    def fetch_messages(self, msg_ids, uid=False):
+        """Fetch and parse messages, many per FETCH command"""
+        import email
+        
+        messages = []
+        self.store_hits = 0
+        for batch in self.fetch_stored(msg_ids, uid):
+            for msg_uid, raw_email in batch:
+                try:
+                    msg = email.message_from_bytes(raw_email)
+                    messages.append(self.build_message_info(msg_uid, msg))
+                except Exception as e:
+                    print(f"Error processing message {msg_uid}: {str(e)}")
+                    
+        if self.store_hits:
+            print(f"♻️  {self.store_hits} messages read from the local store")
+        return messages
+        
+    def build_message_info(self, uid, msg):
+        """Build the message summary shown in the list view"""
+        from email.header import decode_header
+        
+        # Decode subject
+        subject_header = msg["Subject"]
+        if subject_header:
+            subject, encoding = decode_header(subject_header)[0]
+            if isinstance(subject, bytes):
+                subject = subject.decode(encoding or 'utf-8', errors='ignore')
+        else:
+            subject = "[No Subject]"
+            
+        # Extract message info
+        return {
+            'uid': uid,
+            'subject': subject,
+            'from': self.format_address(msg.get("From")),
+            'to': self.format_address(msg.get("To")),
+            'date': self.format_date(msg.get("Date")),
+            'body': None,  # Load body only when viewing to save memory
+            'raw_message': msg
+        }
 
     def get_text_body(self, msg):
         """Extract plain text from email message"""
@@ -316,40 +1505,10 @@ class EmailBrowser:
         
         print(f"Loading {len(msg_ids)} messages...")
         
-        for num in msg_ids:
-            try:
-                status, msg_data = self.mail.fetch(num, "(RFC822)")
-                if status != 'OK':
-                    print(f"Failed to fetch message {num}")
-                    continue
-                    
-                raw_email = msg_data[0][1]
-                msg = email.message_from_bytes(raw_email)
-                
-                # Decode subject
-                subject_header = msg["Subject"]
-                if subject_header:
-                    subject, encoding = decode_header(subject_header)[0]
-                    if isinstance(subject, bytes):
-                        subject = subject.decode(encoding or 'utf-8', errors='ignore')
-                else:
-                    subject = "[No Subject]"
-                
-                # Extract message info
-                message_info = {
-                    'id': num,
-                    'subject': subject,
-                    'from': self.format_address(msg.get("From")),
-                    'to': self.format_address(msg.get("To")),
-                    'date': self.format_date(msg.get("Date")),
-                    'body': None,  # Load body only when viewing to save memory
-                    'raw_message': msg
-                }
-                
-                self.messages.append(message_info)
-                
-            except Exception as e:
-                print(f"Error processing message {num}: {str(e)}")
+        try:
+            self.messages = self.fetch_messages(msg_ids)
+        except Exception as e:
+            print(f"Error loading messages: {str(e)}")
         
         print(f"✅ Loaded {len(self.messages)} messages")
         return True
@@ -420,6 +1579,7 @@ class EmailBrowser:
         print("  n: Next message     p: Previous message    v: View selected message")
         print("  f: Change folder    r: Refresh messages    s: Search messages")
         print("  e: Export message   c: Compose message     a: Change account")
+        print("  o: Outbox status    x: Export folder       m: Mailbox stats")
         print("  q: Quit")
 
     def navigate_next(self):
@@ -443,7 +1603,7 @@ class EmailBrowser:
     def search_messages(self, search_term):
         """Search for messages containing a specific term"""
         search_criteria = f'TEXT "{search_term}"'
-        msg_ids = self.fetch_message_ids(criteria=search_criteria)
+        msg_ids = self.fetch_message_ids(criteria=search_criteria, uid=True)
         
         if not msg_ids:
             print(f"No messages found matching '{search_term}'")
@@ -453,39 +1613,10 @@ class EmailBrowser:
         self.messages = []
         self.current_index = 0
         
-        for num in msg_ids:
-            try:
-                status, msg_data = self.mail.fetch(num, "(RFC822)")
-                if status != 'OK':
-                    continue
-                    
-                raw_email = msg_data[0][1]
-                msg = email.message_from_bytes(raw_email)
-                
-                # Decode subject
-                subject_header = msg["Subject"]
-                if subject_header:
-                    subject, encoding = decode_header(subject_header)[0]
-                    if isinstance(subject, bytes):
-                        subject = subject.decode(encoding or 'utf-8', errors='ignore')
-                else:
-                    subject = "[No Subject]"
-                
-                # Extract message info
-                message_info = {
-                    'id': num,
-                    'subject': subject,
-                    'from': self.format_address(msg.get("From")),
-                    'to': self.format_address(msg.get("To")),
-                    'date': self.format_date(msg.get("Date")),
-                    'body': None,
-                    'raw_message': msg
-                }
-                
-                self.messages.append(message_info)
-                
-            except Exception as e:
-                print(f"Error processing message: {str(e)}")
+        try:
+            self.messages = self.fetch_messages(msg_ids, uid=True)
+        except Exception as e:
+            print(f"Error processing message: {str(e)}")
         
         return True
 
@@ -512,6 +1643,139 @@ class EmailBrowser:
             print("Please enter a number")
             return False
 
+    def default_smtp_server(self):
+        """Guess the SMTP server from the IMAP one, e.g. imap.example.com -> smtp.example.com"""
+        if self.imap_server.startswith("imap."):
+            return "smtp." + self.imap_server[len("imap."):]
+        return self.imap_server
+        
+    def setup_outbox(self):
+        """Pick up SMTP settings and the outbox for the current account"""
+        cache = self.account_cache.get(self.account_key(), {})
+        self.smtp_server, self.smtp_port = cache.get('smtp', [self.default_smtp_server(), DEFAULT_SMTP_PORT])
+        
+        # Each account has its own queue so messages go out with the right login
+        self.outbox = Outbox(self.config_dir / "outbox" / self.account_dir_name())
+        
+        # Deliver anything left over from an earlier session
+        if self.outbox.entries() or self.outbox.sent_ids():
+            self.start_outbox_worker()
+            
+    def smtp_connect(self, server, port, user, password):
+        """Open an authenticated SMTP connection, refusing to log in without TLS"""
+        import smtplib
+        import ssl
+        
+        context = ssl.create_default_context()
+        if port == 465:
+            smtp = smtplib.SMTP_SSL(server, port, timeout=SMTP_TIMEOUT, context=context)
+            smtp.ehlo()
+        else:
+            smtp = smtplib.SMTP(server, port, timeout=SMTP_TIMEOUT)
+            smtp.ehlo()
+            if not smtp.has_extn('starttls'):
+                smtp.close()
+                raise smtplib.SMTPNotSupportedError("server does not offer STARTTLS, not sending the password in cleartext")
+            smtp.starttls(context=context)
+            smtp.ehlo()
+        if smtp.has_extn('auth'):
+            smtp.login(user, password)
+        return smtp
+        
+    def start_outbox_worker(self):
+        """Start delivering queued messages in the background"""
+        if self.outbox_worker is None:
+            # Bind this account's settings now, the worker may outlive an account switch
+            self.outbox_worker = OutboxWorker(
+                self.outbox,
+                functools.partial(self.smtp_connect, self.smtp_server, self.smtp_port,
+                                  self.email_user, self.email_password),
+                functools.partial(self.new_imap_connection, self.imap_server, self.imap_port,
+                                  self.email_user, self.email_password),
+                functools.partial(self.find_sent_folder, special_folders=self.special_folders)
+            )
+        self.outbox_worker.start()
+        self.outbox_worker.kick()
+        
+    def stop_outbox_worker(self):
+        """Stop background delivery, unsent messages stay in the outbox"""
+        if self.outbox_worker:
+            if not self.outbox_worker.stop():
+                print("📤 Still finishing a delivery in the background")
+            self.outbox_worker = None
+            left = len(self.outbox.entries())
+            if left:
+                print(f"📤 {left} message(s) left in the outbox, they will be sent next time")
+            
+    def compose_message(self):
+        """Write a new message and put it in the outbox"""
+        from email.message import EmailMessage
+        from email.utils import formatdate, make_msgid, getaddresses
+        import email.policy
+        
+        if not self.outbox:
+            print("Not connected to server")
+            return
+            
+        print("\n" + "=" * 80)
+        print("✉️  COMPOSE MESSAGE")
+        print("=" * 80)
+        to = input("To: ").strip()
+        cc = input("Cc: ").strip()
+        recipients = [addr for name, addr in getaddresses([to, cc]) if addr]
+        if not recipients:
+            print("❌ No recipients, message discarded")
+            return
+            
+        subject = input("Subject: ")
+        print("Body (end with a line containing only '.'):")
+        lines = []
+        while True:
+            line = input()
+            if line == ".":
+                break
+            lines.append(line)
+            
+        msg = EmailMessage()
+        msg['From'] = self.email_user
+        msg['To'] = to
+        if cc:
+            msg['Cc'] = cc
+        msg['Subject'] = subject
+        msg['Date'] = formatdate(localtime=True)
+        msg['Message-ID'] = make_msgid(domain=self.email_user.rpartition('@')[2] or None)
+        body = "\n".join(lines) + "\n"
+        # The default would be 8bit, which a server without 8BITMIME may mangle
+        msg.set_content(body, cte=None if body.isascii() else 'quoted-printable')
+        
+        self.outbox.enqueue(msg.as_bytes(policy=email.policy.SMTP), self.email_user, recipients)
+        self.start_outbox_worker()
+        print(f"📤 Message queued for {', '.join(recipients)} ({len(self.outbox.entries())} in outbox)")
+        
+    def show_outbox(self):
+        """Show what is waiting in the outbox"""
+        if not self.outbox:
+            print("Not connected to server")
+            return
+            
+        entries = self.outbox.entries()
+        failed = self.outbox.failed_entries()
+        print(f"\n📤 Outbox: {len(entries)} queued, {len(self.outbox.sent_ids())} waiting for Sent, {len(failed)} failed")
+        for entry in entries:
+            retry = ""
+            if entry['last_error']:
+                retry = f" (retry at {datetime.fromtimestamp(entry['next_attempt']):%H:%M:%S}: {entry['last_error']})"
+            print(f"  → {', '.join(entry['recipients'])}{retry}")
+        for entry in failed:
+            print(f"  ✗ {', '.join(entry['recipients'])}: {entry['last_error']}")
+        if self.outbox_worker and self.outbox_worker.last_error:
+            print(f"Last error: {self.outbox_worker.last_error}")
+            
+        if failed and input("\nRequeue failed messages? (y/n): ").lower() == 'y':
+            count = self.outbox.requeue_failed()
+            self.start_outbox_worker()
+            print(f"📤 {count} message(s) queued again")
+
     def disconnect(self):
         """Disconnect from the email server"""
         if self.mail:
@@ -639,6 +1903,7 @@ class EmailBrowser:
                 content_id = part.get('Content-ID')
                 if content_id:
                     # This is likely an inline image
+                    import mimetypes
                     extension = mimetypes.guess_extension(part.get_content_type())
                     if extension:
                         filename = f"inline_image_{attachment_count}{extension}"
@@ -665,6 +1930,215 @@ class EmailBrowser:
         else:
             print("ℹ️ No attachments found")
 
+    def export_folder(self):
+        """Export every message in the selected folder as .eml, resuming an earlier run"""
+        if not self.mail or not self.selected_folder:
+            print("Not connected or no folder selected")
+            return
+            
+        sanitized_folder = "".join(c for c in self.selected_folder if c.isalnum() or c in " ._-").strip()
+        folder_dir = Path("exported_emails") / (sanitized_folder or "folder")
+        folder_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Progress is kept on disk so a rerun only fetches what is still missing
+        progress_file = folder_dir / "export_progress.json"
+        last_uid = 0
+        if progress_file.exists():
+            try:
+                with open(progress_file, 'r') as f:
+                    progress = json.load(f)
+                if progress['uidvalidity'] == self.uidvalidity:
+                    last_uid = progress['last_uid']
+                else:
+                    print("⚠️ Folder changed on the server since the last export, starting over")
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error reading export progress: {str(e)}")
+                
+        try:
+            uids = self.uids_after(last_uid)
+        except Exception as e:
+            print(f"❌ Error listing messages: {str(e)}")
+            return
+            
+        if not uids:
+            print(f"✅ {folder_dir} is already up to date")
+            return
+            
+        print(f"Exporting {len(uids)} messages from {self.selected_folder}...")
+        exported = 0
+        self.store_hits = 0
+        try:
+            for batch in self.fetch_stored(uids, uid=True, stop_at_gap=True):
+                for msg_uid, raw_email in batch:
+                    with open(folder_dir / f"{msg_uid}.eml", 'wb') as f:
+                        f.write(raw_email)
+                    exported += 1
+                    
+                batch_uids = [msg_uid for msg_uid, raw_email in batch if msg_uid is not None]
+                if batch_uids:
+                    last_uid = max(last_uid, max(batch_uids))
+                    tmp_file = progress_file.with_suffix('.tmp')
+                    with open(tmp_file, 'w') as f:
+                        json.dump({'uidvalidity': self.uidvalidity, 'last_uid': last_uid}, f)
+                    os.replace(tmp_file, progress_file)
+        except Exception as e:
+            print(f"❌ Error during export: {str(e)}")
+            
+        print(f"✅ Exported {exported} messages to {folder_dir}")
+        if self.store_hits:
+            print(f"♻️  {self.store_hits} of them were already in the local store")
+        if exported < len(uids):
+            print(f"ℹ️ {len(uids) - exported} messages left, export again to continue")
+
+    def parse_header_fields(self, header_data):
+        """Parse a block of header lines into a dict keyed by lowercase field name"""
+        text = header_data.decode('utf-8', errors='replace')
+        fields = {}
+        # Unfold continuation lines first
+        for line in re.sub(r'\r?\n[ \t]+', ' ', text).splitlines():
+            name, sep, value = line.partition(':')
+            if sep:
+                fields.setdefault(name.strip().lower(), value.strip())
+        return fields
+        
+    def load_header_stats(self):
+        """Fetch sender, date and size of every message in the folder into a MailboxStats"""
+        from email.utils import parseaddr, parsedate_tz, mktime_tz
+        
+        # Every message is wanted, so sequence numbers give short 1:5000 style ranges
+        msg_ids = self.fetch_message_ids()
+        if not msg_ids:
+            return None
+            
+        print(f"Fetching headers for {len(msg_ids)} messages...")
+        msg_uids, timestamps, sender_ids, sizes = [], [], [], []
+        senders = []
+        sender_index = {}       # address -> sender id
+        raw_from_index = {}     # raw From header -> sender id, saves a parseaddr per repeat
+        
+        items = "(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS (FROM DATE)])"
+        for batch in self.fetch_in_batches(msg_ids, items, batch_size=HEADER_BATCH_SIZE):
+            for msg_uid, meta, header_data in batch:
+                fields = self.parse_header_fields(header_data)
+                
+                raw_from = fields.get('from', '')
+                sender_id = raw_from_index.get(raw_from)
+                if sender_id is None:
+                    address = parseaddr(raw_from)[1].lower() or "[No address]"
+                    sender_id = sender_index.get(address)
+                    if sender_id is None:
+                        sender_id = sender_index[address] = len(senders)
+                        senders.append(address)
+                    raw_from_index[raw_from] = sender_id
+                    
+                try:
+                    parsed = parsedate_tz(fields.get('date', ''))
+                    timestamp = mktime_tz(parsed) if parsed else -1
+                except (TypeError, ValueError, OverflowError):
+                    timestamp = -1
+                    
+                size_match = re.search(rb'RFC822\.SIZE (\d+)', meta)
+                
+                msg_uids.append(msg_uid or 0)
+                timestamps.append(timestamp)
+                sender_ids.append(sender_id)
+                sizes.append(int(size_match.group(1)) if size_match else 0)
+                
+        return MailboxStats(msg_uids, timestamps, sender_ids, sizes, senders)
+        
+    def format_size(self, size):
+        """Format a byte count for display"""
+        for unit in ("B", "KB", "MB", "GB"):
+            if size < 1024 or unit == "GB":
+                return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+            size /= 1024
+            
+    def show_mailbox_stats(self):
+        """Show top senders, mail volume over time and message sizes for the folder"""
+        if not self.mail or not self.selected_folder:
+            print("Not connected or no folder selected")
+            return
+            
+        try:
+            import numpy as np
+        except ImportError:
+            print("❌ Mailbox stats need NumPy, install it with: pip install numpy")
+            return
+            
+        try:
+            stats = self.load_header_stats()
+        except Exception as e:
+            print(f"❌ Error fetching headers: {str(e)}")
+            return
+            
+        if not stats:
+            print("No messages found")
+            return
+            
+        utc_offset = time.localtime().tm_gmtoff
+        bar_width = 40
+        
+        def bar(count, largest):
+            return "█" * int(round(bar_width * count / largest)) if largest else ""
+            
+        summary, buckets = stats.size_distribution()
+        print(f"\n{'=' * 80}")
+        print(f"📊 MAILBOX STATS: {self.selected_folder} ({len(stats)} messages, {self.format_size(summary['total'])})")
+        print(f"{'=' * 80}")
+        
+        print("\nTop senders:")
+        for rank, (address, count, total_bytes) in enumerate(stats.top_senders(10), 1):
+            print(f"  {rank:2d}. {address[:45]:45} {count:8d} msgs {self.format_size(total_bytes):>10}")
+            
+        first_day, per_day = stats.volume_per_day(utc_offset)
+        if len(per_day):
+            # Two weeks ending at the latest day with mail that is not after
+            # today, so future-dated messages (usually spam) don't move it
+            today = (int(time.time()) - first_day) // 86400
+            end = min(len(per_day), today + 1)
+            if end > 0:
+                end = int(np.nonzero(per_day[:end])[0][-1]) + 1 if per_day[:end].any() else end
+                shown = per_day[max(0, end - 14):end]
+                start = first_day + (end - len(shown)) * 86400
+                print("\nMessages per day:")
+                for i, count in enumerate(shown):
+                    day = datetime.fromtimestamp(start + i * 86400)
+                    print(f"  {day:%Y-%m-%d %a} | {bar(count, shown.max()):{bar_width}} {count}")
+            future = int(per_day[max(end, 0):].sum())
+            if future:
+                print(f"  ({future} messages dated in the future)")
+                
+            weekdays = stats.weekday_histogram(utc_offset)
+            print("\nMessages per weekday:")
+            for name, count in zip(("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"), weekdays):
+                print(f"  {name} | {bar(count, weekdays.max()):{bar_width}} {count}")
+                
+            hours = stats.hour_histogram(utc_offset)
+            levels = " ▁▂▃▄▅▆▇█"
+            spark = "".join(levels[int(count * (len(levels) - 1) / hours.max())] for count in hours)
+            print(f"\nMessages per hour: 00 {spark} 23")
+            
+            # One offset for all messages, so those from the other side of a
+            # daylight saving change land an hour off
+            offset_hours, offset_minutes = divmod(abs(utc_offset) // 60, 60)
+            sign = "+" if utc_offset >= 0 else "-"
+            print(f"  (days and hours use the current UTC offset {sign}{offset_hours:02d}:{offset_minutes:02d} for every message)")
+            
+        undated = int(np.count_nonzero(stats.timestamps < 0))
+        if undated:
+            print(f"  ({undated} messages without a usable date)")
+            
+        print(f"\nSizes: median {self.format_size(summary['median'])}, 90% {self.format_size(summary['p90'])}, "
+              f"99% {self.format_size(summary['p99'])}, largest {self.format_size(summary['max'])}")
+        nonzero = np.nonzero(buckets)[0]
+        for k in range(nonzero.min(), nonzero.max() + 1):
+            print(f"  {self.format_size(2 ** k):>9} - {self.format_size(2 ** (k + 1)):>9} | {bar(buckets[k], buckets.max()):{bar_width}} {buckets[k]}")
+            
+        print("\nLargest messages:")
+        for msg_uid, size in stats.largest(5):
+            print(f"  UID {msg_uid:<10d} {self.format_size(size):>10}")
+        print(f"{'=' * 80}")
+
     def run(self):
         """Main application loop"""
         # Configure connection settings first
@@ -676,12 +2150,11 @@ class EmailBrowser:
         if not self.connect():
             return
             
-        # Default to Sent folder
-        if not self.select_folder("Sent"):
-            if not self.select_folder("INBOX"):  # Fallback to inbox
-                print("Could not select any folder")
-                self.disconnect()
-                return
+        # Default to Sent folder, falling back to inbox
+        if not self.select_default_folder():
+            print("Could not select any folder")
+            self.disconnect()
+            return
                 
         # Load initial messages
         self.load_messages(20)
@@ -710,6 +2183,7 @@ class EmailBrowser:
             elif choice == 'l':
                 self.display_message_list()
             elif choice == 'r':
+                self.check_new_messages()
                 self.load_messages(20)
                 self.display_message_list()
             elif choice == 'f':
@@ -725,13 +2199,27 @@ class EmailBrowser:
                 input("Press Enter to continue...")
                 self.display_message_list()
             elif choice == 'c':
-                print("Compose feature not implemented yet")
+                self.compose_message()
+                input("Press Enter to continue...")
+                self.display_message_list()
+            elif choice == 'o':
+                self.show_outbox()
+                input("Press Enter to continue...")
+                self.display_message_list()
+            elif choice == 'm':
+                self.show_mailbox_stats()
+                input("Press Enter to continue...")
+                self.display_message_list()
+            elif choice == 'x':
+                self.export_folder()
+                input("Press Enter to continue...")
+                self.display_message_list()
             elif choice == 'a':
                 print("\nChanging email account...")
+                self.stop_outbox_worker()
                 self.disconnect()
                 if self.configure_connection() and self.connect():
-                    if not self.select_folder("Sent"):
-                        self.select_folder("INBOX")
+                    self.select_default_folder()
                     self.load_messages(20)
                     self.display_message_list()
                 else:
@@ -741,6 +2229,7 @@ class EmailBrowser:
                 print("Unknown command. Type 'h' for help.")
                 
         # Disconnect when done
+        self.stop_outbox_worker()
         self.disconnect()
 
 